@@ -1,47 +1,7 @@
-import os
 import cv2
 import numpy as np
-import requests
 
-def download_model_files():
-    """
-    Downloads the YOLOv3-tiny model files if they are not already present.
-    """
-    model_dir = "models"
-    files_to_download = {
-        "yolov4-tiny.weights": "https://github.com/AlexeyAB/darknet/releases/download/darknet_yolo_v4_pre/yolov4-tiny.weights",
-        "yolov4-tiny.cfg": "https://raw.githubusercontent.com/AlexeyAB/darknet/master/cfg/yolov4-tiny.cfg",
-        "coco.names": "https://raw.githubusercontent.com/AlexeyAB/darknet/master/data/coco.names",
-    }
-
-    if not os.path.exists(model_dir):
-        os.makedirs(model_dir)
-
-    for filename, url in files_to_download.items():
-        filepath = os.path.join(model_dir, filename)
-        if not os.path.exists(filepath):
-            print(f"Downloading {filename}...")
-            try:
-                response = requests.get(url, stream=True)
-                response.raise_for_status()
-                with open(filepath, "wb") as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                print(f"Successfully downloaded {filename}.")
-            except requests.exceptions.RequestException as e:
-                print(f"Error downloading {filename}: {e}")
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                raise
-
-def preprocess_image(image, alpha=1.2, beta=10):
-    """
-    Applies brightness and contrast adjustment.
-    alpha: contrast control (1.0-3.0)
-    beta: brightness control (0-100)
-    """
-    adjusted_image = cv2.convertScaleAbs(image, alpha=alpha, beta=beta)
-    return adjusted_image
+from yolo_backend import detect, detect_batch
 
 def detect_ingredients(image: np.ndarray, confidence_threshold: float = 0.3, nms_threshold: float = 0.4):
     """
@@ -53,70 +13,25 @@ def detect_ingredients(image: np.ndarray, confidence_threshold: float = 0.3, nms
         nms_threshold: The threshold for non-maxima suppression.
 
     Returns:
-        A list of tuples, where each tuple contains the detected
-        ingredient name and its bounding box (x, y, w, h).
+        A list of dicts, one per detected ingredient, with its "label",
+        "confidence" and bounding "box" (x, y, w, h).
     """
-    download_model_files()
-
-    # Apply preprocessing to the input image
-    image = preprocess_image(image)
-
-    weights_path = os.path.join("models", "yolov4-tiny.weights")
-    config_path = os.path.join("models", "yolov4-tiny.cfg")
-    names_path = os.path.join("models", "coco.names")
-
-    with open(names_path, "r") as f:
-        classes = [line.strip() for line in f.readlines()]
-
-    food_items = {
-        'bottle', 'wine glass', 'cup', 'fork', 'knife', 'spoon', 'bowl',
-        'banana', 'apple', 'sandwich', 'orange', 'broccoli', 'carrot',
-        'hot dog', 'pizza', 'donut', 'cake'
-    }
+    return detect(image, confidence_threshold, nms_threshold)
 
-    net = cv2.dnn.readNet(weights_path, config_path)
-    net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
-    net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
-    layer_names = net.getLayerNames()
-    output_layers = [layer_names[i - 1] for i in net.getUnconnectedOutLayers().flatten()]
-
-    height, width, _ = image.shape
-    blob = cv2.dnn.blobFromImage(image, 1 / 255.0, (416, 416), swapRB=True, crop=False)
-
-    net.setInput(blob)
-    layer_outputs = net.forward(output_layers)
-
-    boxes = []
-    confidences = []
-    class_ids = []
-
-    for output in layer_outputs:
-        for detection in output:
-            scores = detection[5:]
-            class_id = np.argmax(scores)
-            confidence = scores[class_id]
-            if confidence > confidence_threshold:
-                center_x = int(detection[0] * width)
-                center_y = int(detection[1] * height)
-                w = int(detection[2] * width)
-                h = int(detection[3] * height)
-                x = int(center_x - w / 2)
-                y = int(center_y - h / 2)
-                boxes.append([x, y, w, h])
-                confidences.append(float(confidence))
-                class_ids.append(class_id)
-
-    indexes = cv2.dnn.NMSBoxes(boxes, confidences, confidence_threshold, nms_threshold)
+def detect_ingredients_batch(images, confidence_threshold: float = 0.3, nms_threshold: float = 0.4):
+    """
+    Detects ingredients in several images with a single forward pass.
 
-    results = []
-    if len(indexes) > 0:
-        for i in indexes.flatten():
-            label = str(classes[class_ids[i]])
-            if label in food_items:
-                x, y, w, h = boxes[i]
-                results.append((label, (x, y, w, h)))
+    Args:
+        images: A list of input images as NumPy arrays.
+        confidence_threshold: The minimum probability to filter weak detections.
+        nms_threshold: The threshold for non-maxima suppression.
 
-    return results
+    Returns:
+        One list of detections per image, in the format returned by
+        detect_ingredients().
+    """
+    return detect_batch(images, confidence_threshold, nms_threshold)
 
 
 if __name__ == '__main__':
@@ -148,8 +63,8 @@ if __name__ == '__main__':
 
                 print(f"\n--- Detection Results ---")
                 if detected_ingredients:
-                    for item_name, box in detected_ingredients:
-                        print(f"  - Found '{item_name}' at bounding box: {box}")
+                    for item in detected_ingredients:
+                        print(f"  - Found '{item['label']}' ({item['confidence']:.2f}) at bounding box: {item['box']}")
                 else:
                     print("  No ingredients were detected.")
 
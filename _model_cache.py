@@ -0,0 +1,80 @@
+"""
+Downloads and caches the model files used by the food detector.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+MODEL_DIR = "models"
+
+MODEL_FILES = {
+    "yolov4-tiny.weights": "https://github.com/AlexeyAB/darknet/releases/download/darknet_yolo_v4_pre/yolov4-tiny.weights",
+    "yolov4-tiny.cfg": "https://raw.githubusercontent.com/AlexeyAB/darknet/master/cfg/yolov4-tiny.cfg",
+    "coco.names": "https://raw.githubusercontent.com/AlexeyAB/darknet/master/data/coco.names",
+}
+
+CHUNK_SIZE = 1 << 20
+
+
+def _download_file(session, url, filepath):
+    """
+    Streams url to filepath.
+
+    The data is written to a ".part" file that only replaces filepath once
+    the download is complete, so an interrupted download never leaves a
+    truncated model file behind.
+    """
+    filename = os.path.basename(filepath)
+    part_path = filepath + ".part"
+    print(f"Downloading {filename}...")
+    try:
+        with session.get(url, stream=True) as response:
+            response.raise_for_status()
+            # Content-Length counts encoded bytes, so it can only be checked
+            # against the decoded size when the body is sent as-is.
+            expected_size = None
+            if response.headers.get("Content-Encoding", "identity") == "identity":
+                expected_size = response.headers.get("Content-Length")
+            written = 0
+            with open(part_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+                    written += len(chunk)
+        if expected_size is not None and written != int(expected_size):
+            raise requests.exceptions.RequestException(
+                f"Incomplete download of {filename}: got {written} of {expected_size} bytes"
+            )
+        os.replace(part_path, filepath)
+        print(f"Successfully downloaded {filename}.")
+    except requests.exceptions.RequestException as e:
+        print(f"Error downloading {filename}: {e}")
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+
+def download_model_files():
+    """
+    Downloads the YOLOv4-tiny model files if they are not already present.
+
+    Missing files are fetched in parallel over a shared session so that
+    connections to the same host are reused.
+    """
+    os.makedirs(MODEL_DIR, exist_ok=True)
+
+    missing = {
+        os.path.join(MODEL_DIR, filename): url
+        for filename, url in MODEL_FILES.items()
+        if not os.path.exists(os.path.join(MODEL_DIR, filename))
+    }
+    if not missing:
+        return
+
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=len(missing)) as executor:
+        futures = [
+            executor.submit(_download_file, session, url, filepath)
+            for filepath, url in missing.items()
+        ]
+        for future in futures:
+            future.result()
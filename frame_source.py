@@ -0,0 +1,102 @@
+"""
+This module provides the video frames that the detection loop processes.
+"""
+import os
+import sys
+from threading import Thread, Lock
+
+import cv2
+import numpy as np
+
+TEST_IMAGE_PATH = os.path.join("test_images", "dog.jpg")
+
+
+def load_test_frame(image_path=TEST_IMAGE_PATH):
+    """
+    Loads a still test frame without decoding the JPEG every time.
+
+    The image is decoded and its raw BGR pixels saved next to it as a .npy
+    file whenever that file is missing or older than the image; otherwise
+    the .npy file is memory-mapped instead.
+
+    Args:
+        image_path: The path of the test image.
+
+    Returns:
+        A read-only NumPy array with the frame, or None if the image could
+        not be read.
+    """
+    cache_path = image_path + ".npy"
+    try:
+        image_mtime = os.path.getmtime(image_path)
+    except OSError:
+        return None
+    if not os.path.exists(cache_path) or os.path.getmtime(cache_path) < image_mtime:
+        frame = cv2.imread(image_path)
+        if frame is None:
+            return None
+        # Write to a per-process file and move it into place, so that a
+        # concurrent reader never maps a half-written cache
+        part_path = f"{cache_path}.{os.getpid()}.part"
+        with open(part_path, "wb") as f:
+            np.save(f, frame)
+        os.replace(part_path, cache_path)
+    return np.load(cache_path, mmap_mode="r")
+
+
+def open_video_capture(source):
+    """
+    Opens a video source with the smallest possible frame buffer.
+
+    Camera indices are opened with V4L2 on Linux, which avoids the slow
+    stream probing of the default FFMPEG backend.
+    """
+    if isinstance(source, int) and sys.platform.startswith("linux"):
+        capture = cv2.VideoCapture(source, cv2.CAP_V4L2)
+    else:
+        capture = cv2.VideoCapture(source)
+    capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return capture
+
+
+class FreshestFrame(Thread):
+    """
+    Continuously grabs frames from a video capture in the background so that
+    the most recent frame is always available.
+
+    Frames are only grabbed, not decoded, until latest() is called, so
+    frames that are never used cost no decoding work, and the capture's
+    internal buffer never holds stale frames.
+    """
+
+    def __init__(self, capture):
+        super().__init__(daemon=True)
+        self.cap = capture
+        self.lock = Lock()
+        self.running = True
+        self.has_frame = False
+
+    def run(self):
+        while self.running:
+            with self.lock:
+                grabbed = self.cap.grab()
+                self.has_frame = self.has_frame or grabbed
+            if not grabbed:
+                self.running = False
+
+    def latest(self):
+        """
+        Decodes and returns the most recently grabbed frame, or None if no
+        frame is available.
+        """
+        with self.lock:
+            if not self.has_frame:
+                return None
+            ok, frame = self.cap.retrieve()
+        return frame if ok else None
+
+    def stop(self):
+        """Stops grabbing and releases the capture."""
+        self.running = False
+        self.join()
+        self.cap.release()
@@ -1,9 +1,46 @@
-from flask import Flask, jsonify
-from flask_socketio import SocketIO, emit
+if __name__ == '__main__':
+    # Patch the standard library for eventlet before anything else imports
+    # it. The video worker is started with the 'spawn' method, so it
+    # re-imports this module as '__mp_main__', skips this and keeps real
+    # OS threads for its blocking OpenCV calls.
+    import eventlet
+    eventlet.monkey_patch()
+    import eventlet.wsgi
+
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import time
+import orjson
+from flask import Flask, Response, jsonify
+from flask.json.provider import JSONProvider
+from flask_socketio import SocketIO, emit, join_room
 import cv2
+import numpy as np
 from threading import Thread, Event
 from FoodDetector import detect_ingredients
-from progress_tracker import FoodItemTracker
+from progress_tracker import TrackerPool, mark_step_completed
+from frame_source import FreshestFrame, load_test_frame, open_video_capture
+
+log = logging.getLogger('cook')
+
+def configure_logging(level=logging.INFO):
+    """
+    Routes this process's log records through a queue, so that callers
+    never block on writing to the console. A listener thread drains the
+    queue into a stream handler. Returns the started listener.
+    """
+    log_queue = queue.SimpleQueue()
+    log.addHandler(logging.handlers.QueueHandler(log_queue))
+    log.setLevel(level)
+    log.propagate = False
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    return listener
 
 class RecipeStateManager:
     """Manages the state of the current recipe, including steps and timers."""
@@ -20,30 +57,69 @@ class RecipeStateManager:
         self.current_step_index = 0
         self.timer_remaining = self._recipe["steps"][0]["duration"]
         self.timer_is_running = False # Start in a paused state
+        # Set while the timer runs, so the timer loop can sleep while paused
+        self._running_event = Event()
+        # The status and its JSON encoding are built once per state change
+        self._status_cache_dict = None
+        self._status_cache_json = None
+        # The status as last pushed to clients, used to send only changes
+        self._last_pushed_status = {}
+
+    def _invalidate(self):
+        """Drops the cached status after the state has changed."""
+        self._status_cache_dict = None
+        self._status_cache_json = None
 
     def get_current_status(self):
-        """Returns the current state of the recipe."""
-        current_step = self._recipe["steps"][self.current_step_index]
-        return {
-            "recipe_name": self._recipe["name"],
-            "current_step": current_step["description"],
-            "current_step_index": self.current_step_index,
-            "total_steps": len(self._recipe["steps"]),
-            "timer_remaining": self.timer_remaining,
-            "timer_is_running": self.timer_is_running
-        }
+        """
+        Returns the current state of the recipe.
+        The returned dict is shared between callers and must not be modified.
+        """
+        if self._status_cache_dict is None:
+            current_step = self._recipe["steps"][self.current_step_index]
+            self._status_cache_dict = {
+                "recipe_name": self._recipe["name"],
+                "current_step": current_step["description"],
+                "current_step_index": self.current_step_index,
+                "total_steps": len(self._recipe["steps"]),
+                "timer_remaining": self.timer_remaining,
+                "timer_is_running": self.timer_is_running
+            }
+        return self._status_cache_dict
+
+    def get_current_status_json(self):
+        """Returns the current state of the recipe encoded as JSON bytes."""
+        if self._status_cache_json is None:
+            self._status_cache_json = orjson.dumps(self.get_current_status())
+        return self._status_cache_json
+
+    def _push_changes(self):
+        """
+        Notifies clients of the status fields that changed since the last
+        update. Clients merge each update into the full status they were
+        sent on connect.
+        """
+        status = self.get_current_status()
+        changes = {k: v for k, v in status.items() if self._last_pushed_status.get(k) != v}
+        self._last_pushed_status = status
+        if changes:
+            push_progress_update(changes)
 
     def pause_timer(self):
         """Pauses the timer and notifies clients."""
         self.timer_is_running = False
-        print("INFO: Timer paused.")
-        push_progress_update(self.get_current_status())
+        self._running_event.clear()
+        self._invalidate()
+        log.info("Timer paused.")
+        self._push_changes()
 
     def resume_timer(self):
         """Resumes the timer and notifies clients."""
         self.timer_is_running = True
-        print("INFO: Timer resumed.")
-        push_progress_update(self.get_current_status())
+        self._running_event.set()
+        self._invalidate()
+        log.info("Timer resumed.")
+        self._push_changes()
 
     def next_step(self):
         """Advances to the next step and notifies clients."""
@@ -52,26 +128,71 @@ class RecipeStateManager:
             new_step = self._recipe["steps"][self.current_step_index]
             self.timer_remaining = new_step["duration"]
             self.timer_is_running = False  # Always start new steps paused
-            print(f"INFO: Advanced to step {self.current_step_index + 1}: {new_step['description']}")
-            push_progress_update(self.get_current_status())
+            self._running_event.clear()
+            self._invalidate()
+            log.info("Advanced to step %d: %s", self.current_step_index + 1, new_step['description'])
+            self._push_changes()
             return True
         else:
-            print("INFO: Already on the final step.")
+            log.info("Already on the final step.")
             return False
 
+    def wait_until_running(self):
+        """Blocks until the timer is running."""
+        self._running_event.wait()
+
     def _decrement_timer(self):
         """Decrements the timer by one second if it is running."""
         if self.timer_is_running and self.timer_remaining > 0:
             self.timer_remaining -= 1
-            # Push updates every second while timer is running
-            push_progress_update(self.get_current_status())
+            self._invalidate()
+            # Clients count down locally, so only resync them every few
+            # seconds and when the timer runs out
+            if self.timer_remaining % TIMER_SYNC_INTERVAL == 0:
+                self._push_changes()
+
+class ORJSONProvider(JSONProvider):
+    """Flask JSON provider that encodes responses with orjson."""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+class ORJSONSocketIOAdapter:
+    """
+    Adapter that lets Socket.IO encode packets with orjson. Socket.IO passes
+    json.dumps-style keyword arguments, which orjson does not take.
+    """
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    @staticmethod
+    def loads(s, *args, **kwargs):
+        return orjson.loads(s)
 
 # Create a single instance of the state manager to be used by the app
 recipe_manager = RecipeStateManager()
 
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 app.config['SECRET_KEY'] = 'secret!' # In a real app, this should be a real secret
-socketio = SocketIO(app)
+# Optional message queue URL (e.g. redis://localhost:6379/0). When set,
+# emits are published once to the queue and fanned out to clients by the
+# Socket.IO server, instead of being sent to every client from this process.
+app.config['SOCKETIO_MESSAGE_QUEUE'] = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+# What the video processing loop reports: 'events' sends every detection to
+# clients, 'tracker' follows detected items and completes recipe steps when
+# they are cooked.
+app.config['DETECTION_MODE'] = os.environ.get('DETECTION_MODE', 'events')
+DETECTION_MODES = ('events', 'tracker')
+if app.config['DETECTION_MODE'] not in DETECTION_MODES:
+    raise ValueError(
+        f"DETECTION_MODE must be one of {', '.join(DETECTION_MODES)}, "
+        f"got {app.config['DETECTION_MODE']!r}"
+    )
+socketio = SocketIO(app, async_mode='eventlet', message_queue=app.config['SOCKETIO_MESSAGE_QUEUE'], json=ORJSONSocketIOAdapter)
 
 @app.route('/')
 def index():
@@ -80,7 +201,7 @@ def index():
 @app.route('/progress')
 def progress():
     """Returns the current cooking progress status."""
-    return jsonify(recipe_manager.get_current_status())
+    return Response(recipe_manager.get_current_status_json(), mimetype='application/json')
 
 # --- Command Endpoints ---
 
@@ -104,75 +225,336 @@ def command_resume_timer():
     recipe_manager.resume_timer()
     return jsonify({"status": "ok", "message": "Timer resumed."})
 
+# Every client joins this room on connect, so broadcasts go to the room and
+# each packet is encoded once for all recipients
+CLIENTS_ROOM = 'progress'
+
 @socketio.on('connect')
 def handle_connect():
     """Handles a new client connection."""
-    print('Client connected')
+    log.info('Client connected')
+    join_room(CLIENTS_ROOM)
+    # Later progress updates only carry changed fields, so start the client
+    # off with the full status
+    emit('progress_updates', [recipe_manager.get_current_status()])
     # Send a welcome message to the client that just connected
     emit('status_update', {'data': 'Welcome to the AR Cooking Assistant API!'})
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handles a client disconnection."""
-    print('Client disconnected')
+    log.info('Client disconnected')
+
+# Seconds between timer updates pushed to clients while the timer runs
+TIMER_SYNC_INTERVAL = 5
+
+# Progress updates waiting to be sent by flush_progress_updates()
+pending_updates = []
 
 def push_progress_update(progress_data):
     """
-    Pushes a progress update to all connected clients.
+    Queues a progress update for all connected clients.
     This function will be called from the progress tracking logic.
     """
-    socketio.emit('progress_update', progress_data, broadcast=True)
+    pending_updates.append(progress_data)
+
+def flush_progress_updates():
+    """
+    A background task that sends all queued progress updates as a single
+    'progress_updates' message every 250 ms.
+    """
+    while not thread_stop_event.is_set():
+        if pending_updates:
+            updates = pending_updates[:]
+            del pending_updates[:len(updates)]
+            log.debug("Sending %d progress update(s).", len(updates))
+            socketio.emit('progress_updates', updates, to=CLIENTS_ROOM)
+        socketio.sleep(0.25)
 
-def send_food_detected_event(item_data):
+def send_food_detected_event(event_data):
     """Sends a food detection event to all connected clients."""
-    event_data = {
-        "event": "food_detected",
-        "item": item_data["label"],
-        "confidence": item_data["confidence"]
-    }
-    socketio.emit('detection_event', event_data, broadcast=True)
+    socketio.emit('detection_event', event_data, to=CLIENTS_ROOM)
 
 # Global state for thread control
 thread_stop_event = Event()
+# The video worker is spawned rather than forked, so it does not inherit
+# the eventlet-patched state of the server process
+mp_context = multiprocessing.get_context('spawn')
+detection_stop_event = mp_context.Event()
+
+NS_PER_SECOND = 1_000_000_000
 
 def timer_thread_loop():
-    """A background thread that manages the recipe timer."""
+    """
+    A background thread that manages the recipe timer.
+
+    Ticks are scheduled against absolute monotonic deadlines, so time spent
+    handling a tick or oversleeping does not accumulate as drift; a late
+    tick is caught up by the following ones.
+    """
+    next_tick = time.monotonic_ns() + NS_PER_SECOND
     while not thread_stop_event.is_set():
+        if not recipe_manager.timer_is_running:
+            # Sleep until resumed, then start a full second from there
+            recipe_manager.wait_until_running()
+            next_tick = time.monotonic_ns() + NS_PER_SECOND
+            continue
+
+        socketio.sleep(max(0, next_tick - time.monotonic_ns()) / NS_PER_SECOND)
         recipe_manager._decrement_timer()
-        socketio.sleep(1)
+        next_tick += NS_PER_SECOND
 
-def video_processing_loop():
+def update_food_trackers(food_trackers, food_tracker_ids, detected_items, frame):
     """
-    Main loop to process video, detect food, and send WebSocket events.
+    Updates the tracked food items with the latest detections.
+
+    Only the most confident detection of each label is tracked, and items
+    are identified by their label.
+
+    Returns:
+        The labels of the items that changed to "cooked" in this frame.
     """
-    print("Video processing loop started.")
-    frame = cv2.imread("test_images/dog.jpg")
-    if frame is None:
-        print("Error: Could not load test image. Stopping processing loop.")
-        return
+    boxes_by_label = {}
+    for item in detected_items:
+        boxes_by_label.setdefault(item["label"], item["box"])
+
+    labels = list(boxes_by_label)
+    item_ids = [food_tracker_ids.setdefault(label, len(food_tracker_ids)) for label in labels]
+    changed_ids = food_trackers.update(item_ids, list(boxes_by_label.values()), frame)
+    return [labels[item_ids.index(item_id)] for item_id in changed_ids]
+
+# Number of differing dHash bits above which a frame counts as a new scene
+SCENE_CHANGE_DISTANCE = 5
+
+def difference_hash(frame):
+    """
+    Computes a 64-bit perceptual difference hash (dHash) of a frame.
+
+    Each bit records whether a pixel of a 9x8 grayscale thumbnail is
+    brighter than its left-hand neighbour, so frames that look alike have
+    hashes that differ in only a few bits.
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    thumbnail = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = thumbnail[:, 1:] > thumbnail[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+# Number of bytes sampled from a frame to build its content key
+CONTENT_KEY_SAMPLES = 1024
+
+def frame_content_key(frame):
+    """
+    Returns a cheap key that is equal for byte-identical frames.
+
+    Only an evenly spaced sample of the frame's bytes is hashed. Frames
+    from a live camera differ in sensor noise everywhere, so any new frame
+    misses; a repeated still frame always hits.
+    """
+    flat = frame.reshape(-1)
+    step = max(1, flat.size // CONTENT_KEY_SAMPLES)
+    return hash((frame.shape, flat[::step].tobytes()))
+
+def hamming_distance(hash_a, hash_b):
+    """Returns the number of bits that differ between two hashes."""
+    return bin(hash_a ^ hash_b).count("1")
+
+# Run the detector on every DETECT_INTERVAL-th frame and track boxes between,
+# if a cheap box tracker is available
+DETECT_INTERVAL = 5
+
+def create_box_tracker():
+    """
+    Creates a cheap single-object tracker (MOSSE, else KCF), or returns None
+    when OpenCV's contrib modules are not installed. The built-in MIL
+    tracker is not used, as per item it costs about as much as a detector
+    pass.
+    """
+    legacy = getattr(cv2, "legacy", None)
+    if legacy is not None and hasattr(legacy, "TrackerMOSSE_create"):
+        return legacy.TrackerMOSSE_create()
+    if hasattr(cv2, "TrackerKCF_create"):
+        return cv2.TrackerKCF_create()
+    return None
+
+def init_box_trackers(detected_items, frame):
+    """
+    Starts a box tracker for each detected item.
+
+    Returns:
+        A list of (item, tracker) pairs, empty when no cheap tracker is
+        available.
+    """
+    box_trackers = []
+    for item in detected_items:
+        tracker = create_box_tracker()
+        if tracker is None:
+            return []
+        tracker.init(frame, tuple(item["box"]))
+        box_trackers.append((item, tracker))
+    return box_trackers
+
+def update_box_trackers(box_trackers, frame):
+    """
+    Moves every tracked item's box to its position in a new frame.
+
+    Returns:
+        The tracked items in the same format as detect_ingredients(), with
+        updated boxes. Items whose tracker lost them are left out.
+    """
+    tracked_items = []
+    for item, tracker in box_trackers:
+        ok, box = tracker.update(frame)
+        if ok:
+            tracked_items.append(dict(item, box=tuple(int(v) for v in box)))
+    return tracked_items
+
+# Camera index or video file/stream URL to read frames from. When unset, the
+# still test image is used instead.
+VIDEO_SOURCE = os.environ.get('VIDEO_SOURCE')
+if VIDEO_SOURCE is not None and VIDEO_SOURCE.isdigit():
+    VIDEO_SOURCE = int(VIDEO_SOURCE)
+
+# Seconds between processed frames
+DETECTION_PERIOD = 2
+
+def video_processing_loop(event_queue, stop_event, mode='events'):
+    """
+    Main loop to process video and detect food.
+
+    This runs in its own process so that inference never blocks the web
+    server. In 'events' mode every detection is pushed onto event_queue;
+    in 'tracker' mode detections only feed the food trackers, and only
+    cooking state changes are pushed. Events are small dicts, which
+    detection_event_loop() forwards to clients and the recipe state.
+    """
+    log_listener = configure_logging()
+    log.info("Video processing loop started.")
+    # Leave some cores free for the web server process, and let OpenCV use
+    # its SIMD code paths and an OpenCL device when one is available
+    cv2.setNumThreads(max(1, (os.cpu_count() or 2) // 2))
+    cv2.setUseOptimized(True)
+    cv2.ocl.setUseOpenCL(True)
+
+    capture = None
+    if VIDEO_SOURCE is None:
+        # The same read-only frame is reused for every tick
+        frame = load_test_frame()
+        if frame is None:
+            log.error("Could not load test image. Stopping processing loop.")
+            log_listener.stop()
+            return
+    else:
+        capture = open_video_capture(VIDEO_SOURCE)
+        if not capture.isOpened():
+            log.error("Could not open video source %s. Stopping processing loop.", VIDEO_SOURCE)
+            log_listener.stop()
+            return
+        grabber = FreshestFrame(capture)
+        grabber.start()
+
+    food_trackers = TrackerPool()
+    food_tracker_ids = {}
+
+    # Detection only runs on every DETECT_INTERVAL-th frame, and only when the
+    # scene has visibly changed since the last detection; otherwise the
+    # previous detections are reused. Byte-identical frames are recognised
+    # by a sampled content key before the dHash is even computed. In
+    # between, boxes are carried forward by lightweight per-item trackers.
+    # Without a cheap tracker (e.g. no OpenCV contrib modules), every frame
+    # is a detection frame rather than replaying stale boxes. Trackers are
+    # always restarted from the last real detector output, so an item a
+    # tracker lost is picked up again on the next detection frame.
+    detect_interval = DETECT_INTERVAL if create_box_tracker() is not None else 1
+    last_content_key = None
+    last_hash = None
+    last_detections = []
+    detected_items = []
+    box_trackers = []
+    frame_idx = 0
+
+    while not stop_event.is_set():
+        if capture is not None:
+            frame = grabber.latest()
+            if frame is None and not grabber.is_alive():
+                log.error("Could not read from video source. Stopping processing loop.")
+                break
+            if frame is None:
+                stop_event.wait(0.01)
+                continue
 
-    while not thread_stop_event.is_set():
         try:
-            detected_items = detect_ingredients(frame)
+            if frame_idx % detect_interval == 0:
+                content_key = frame_content_key(frame)
+                if content_key != last_content_key:
+                    last_content_key = content_key
+                    frame_hash = difference_hash(frame)
+                    if last_hash is None or hamming_distance(frame_hash, last_hash) > SCENE_CHANGE_DISTANCE:
+                        last_hash = frame_hash
+                        last_detections = detect_ingredients(frame)
+                detected_items = last_detections
+                box_trackers = init_box_trackers(last_detections, frame)
+            elif box_trackers:
+                detected_items = update_box_trackers(box_trackers, frame)
+            frame_idx += 1
 
-            if detected_items:
-                print(f"INFO: Detected {len(detected_items)} food item(s). Sending events.")
+            if detected_items and mode == 'tracker':
+                for label in update_food_trackers(food_trackers, food_tracker_ids, detected_items, frame):
+                    event_queue.put({"event": "item_cooked", "item": label})
+            elif detected_items:
+                log.info("Detected %d food item(s). Sending events.", len(detected_items))
                 for item in detected_items:
-                    send_food_detected_event(item)
+                    event_queue.put({
+                        "event": "food_detected",
+                        "item": item["label"],
+                        "confidence": item["confidence"]
+                    })
 
         except cv2.error as e:
-            print(f"ERROR: Known OpenCV error in detection, cannot proceed. {e}")
-            print("Stopping video processing loop.")
+            log.error("Known OpenCV error in detection, cannot proceed. %s", e)
+            log.error("Stopping video processing loop.")
             break
         except Exception as e:
-            print(f"An unexpected error occurred in the processing loop: {e}")
+            log.exception("An unexpected error occurred in the processing loop: %s", e)
             break
 
-        socketio.sleep(2) # Detection runs every 2 seconds
+        stop_event.wait(DETECTION_PERIOD) # Detection runs every DETECTION_PERIOD seconds
+
+    if capture is not None:
+        grabber.stop()
+    log_listener.stop()
+
+def detection_event_loop(event_queue, detection_process):
+    """
+    A background task that forwards events from the video processing
+    process to connected clients and to the recipe state.
+    """
+    while not thread_stop_event.is_set():
+        try:
+            event_data = event_queue.get_nowait()
+        except queue.Empty:
+            if not detection_process.is_alive():
+                log.info("Video processing process has exited.")
+                return
+            socketio.sleep(0.1)
+            continue
+
+        if event_data["event"] == "food_detected":
+            send_food_detected_event(event_data)
+        elif event_data["event"] == "item_cooked":
+            mark_step_completed(event_data["item"], recipe_manager.next_step)
 
 if __name__ == '__main__':
-    print("Starting background tasks...")
+    configure_logging()
+    log.info("Starting background tasks...")
+    detection_events = mp_context.Queue()
+    detection_process = mp_context.Process(
+        target=video_processing_loop,
+        args=(detection_events, detection_stop_event, app.config['DETECTION_MODE']),
+        daemon=True
+    )
+    detection_process.start()
     socketio.start_background_task(target=timer_thread_loop)
-    socketio.start_background_task(target=video_processing_loop)
-    print("Starting Flask-SocketIO server on http://0.0.0.0:5000")
-    socketio.run(app, host='0.0.0.0', port=5000, allow_unsafe_werkzeug=True)
+    socketio.start_background_task(target=flush_progress_updates)
+    socketio.start_background_task(detection_event_loop, detection_events, detection_process)
+    log.info("Starting eventlet WSGI server on http://0.0.0.0:5000")
+    eventlet.wsgi.server(eventlet.listen(('0.0.0.0', 5000)), app, log_output=False)
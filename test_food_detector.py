@@ -1,5 +1,5 @@
-import cv2
 from FoodDetector import detect_ingredients
+from frame_source import load_test_frame
 
 def main():
     """
@@ -7,7 +7,7 @@ def main():
     """
     image_path = "test_images/dog.jpg"
 
-    image = cv2.imread(image_path)
+    image = load_test_frame(image_path)
 
     if image is None:
         print(f"Error: Could not load image from {image_path}")
@@ -0,0 +1,463 @@
+"""
+This module runs the YOLOv4-tiny food detector.
+
+The network is loaded once per process and shared by every caller, using
+the fastest backend available: TensorRT, OpenCV's CUDA backend, an
+OpenVINO IR, or OpenCV's default CPU backend.
+"""
+import os
+import threading
+import cv2
+import numpy as np
+
+from _model_cache import download_model_files
+
+try:
+    import tensorrt as trt
+    import pycuda.driver as cuda
+except ImportError:
+    trt = None
+
+FOOD_ITEMS = {
+    'bottle', 'wine glass', 'cup', 'fork', 'knife', 'spoon', 'bowl',
+    'banana', 'apple', 'sandwich', 'orange', 'broccoli', 'carrot',
+    'hot dog', 'pizza', 'donut', 'cake'
+}
+
+# Width and height the network takes its input at
+INPUT_SIZE = (416, 416)
+
+# The model is loaded lazily on first use and shared across calls.
+_MODEL_LOCK = threading.Lock()
+_NET = None
+_OUTPUT_LAYERS = None
+_CLASSES = None
+_FOOD_CLASS_MASK = None
+_TRT_ENGINE = None
+
+def preprocess_image(image, alpha=1.2, beta=10):
+    """
+    Applies brightness and contrast adjustment.
+    alpha: contrast control (1.0-3.0)
+    beta: brightness control (0-100)
+    """
+    adjusted_image = cv2.convertScaleAbs(image, alpha=alpha, beta=beta)
+    return adjusted_image
+
+def _has_cuda():
+    """
+    Returns True if OpenCV was built with CUDA and a CUDA device is present.
+    """
+    try:
+        return cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except (AttributeError, cv2.error):
+        return False
+
+class _TensorRTEngine:
+    """
+    Runs the detector through a serialized TensorRT engine.
+
+    The engine is expected to take the same (1, 3, 416, 416) blob as the
+    OpenCV network and to expose the YOLO heads in the same layout as
+    cv2.dnn (one row per candidate: cx, cy, w, h, objectness, class scores),
+    so its outputs can go through the usual post-processing.
+    """
+
+    def __init__(self, engine_path):
+        cuda.init()
+        self.cuda_context = cuda.Device(0).make_context()
+        try:
+            logger = trt.Logger(trt.Logger.WARNING)
+            with open(engine_path, "rb") as f:
+                self.engine = trt.Runtime(logger).deserialize_cuda_engine(f.read())
+            self.context = self.engine.create_execution_context()
+
+            self.inputs = []
+            self.outputs = []
+            self.bindings = []
+            for i in range(self.engine.num_io_tensors):
+                name = self.engine.get_tensor_name(i)
+                shape = tuple(self.engine.get_tensor_shape(name))
+                dtype = trt.nptype(self.engine.get_tensor_dtype(name))
+                host = cuda.pagelocked_empty(trt.volume(shape), dtype)
+                device = cuda.mem_alloc(host.nbytes)
+                self.bindings.append(int(device))
+                if self.engine.get_tensor_mode(name) == trt.TensorIOMode.INPUT:
+                    self.inputs.append((host, device, shape))
+                else:
+                    self.outputs.append((host, device, shape))
+        finally:
+            # The context is made current again for each inference call,
+            # which may happen on a different thread.
+            self.cuda_context.pop()
+
+    def infer(self, blob):
+        """
+        Runs a forward pass and returns one (N, 85) array per output.
+        """
+        self.cuda_context.push()
+        try:
+            host, device, _ = self.inputs[0]
+            np.copyto(host, blob.ravel())
+            cuda.memcpy_htod(device, host)
+            self.context.execute_v2(self.bindings)
+            layer_outputs = []
+            for host, device, shape in self.outputs:
+                cuda.memcpy_dtoh(host, device)
+                layer_outputs.append(host.reshape(-1, shape[-1]).copy())
+            return layer_outputs
+        finally:
+            self.cuda_context.pop()
+
+def build_tensorrt_engine(onnx_path, engine_path):
+    """
+    Builds a TensorRT engine from an ONNX export of the detector and
+    serializes it to engine_path. FP16 kernels are enabled where the GPU
+    supports them.
+    """
+    logger = trt.Logger(trt.Logger.WARNING)
+    builder = trt.Builder(logger)
+    network = builder.create_network(1 << int(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH))
+    parser = trt.OnnxParser(network, logger)
+
+    with open(onnx_path, "rb") as f:
+        if not parser.parse(f.read()):
+            errors = "; ".join(str(parser.get_error(i)) for i in range(parser.num_errors))
+            raise RuntimeError(f"Could not parse {onnx_path}: {errors}")
+
+    config = builder.create_builder_config()
+    if builder.platform_has_fast_fp16:
+        config.set_flag(trt.BuilderFlag.FP16)
+
+    serialized_engine = builder.build_serialized_network(network, config)
+    if serialized_engine is None:
+        raise RuntimeError(f"TensorRT failed to build an engine from {onnx_path}")
+
+    with open(engine_path, "wb") as f:
+        f.write(serialized_engine)
+
+def _load_tensorrt_engine(num_classes):
+    """
+    Returns a TensorRT engine for the detector if TensorRT is installed and
+    an engine (or an ONNX model to build one from) is present in models/.
+    Returns None otherwise, or if the engine's outputs are not in the
+    cv2.dnn layout (5 + num_classes values per candidate), in which case
+    the OpenCV network is used.
+    """
+    if trt is None:
+        return None
+
+    onnx_path = os.path.join("models", "yolov4-tiny.onnx")
+    engine_path = os.path.join("models", "yolov4-tiny.trt")
+
+    try:
+        if not os.path.exists(engine_path):
+            if not os.path.exists(onnx_path):
+                return None
+            print("Building TensorRT engine, this only happens once...")
+            build_tensorrt_engine(onnx_path, engine_path)
+        engine = _TensorRTEngine(engine_path)
+    except Exception as e:
+        print(f"WARNING: Could not load the TensorRT engine, falling back to OpenCV DNN. {e}")
+        return None
+
+    # Exports that split boxes and class scores into separate outputs (as
+    # darknet2onnx does) cannot go through the usual post-processing
+    shapes = [shape for _, _, shape in engine.outputs]
+    if not shapes or any(shape[-1] != 5 + num_classes for shape in shapes):
+        print(f"WARNING: TensorRT engine outputs {shapes} are not in the expected layout, falling back to OpenCV DNN.")
+        return None
+    return engine
+
+def _get_output_layers(net):
+    """
+    Returns the names of the network's output layers.
+    """
+    layer_names = net.getLayerNames()
+    return [layer_names[i - 1] for i in net.getUnconnectedOutLayers().flatten()]
+
+def _load_openvino_net(num_classes):
+    """
+    Loads the detector as an OpenVINO IR on the Inference Engine backend.
+
+    This is only used for CPU inference, and only if OpenCV was built with
+    OpenVINO support and an IR (typically INT8 quantized) has been placed in
+    models/. The IR must produce the same output layout as the darknet
+    model (5 + num_classes values per candidate), which is checked with a
+    forward pass on a blank blob. Returns None if any of this is not the
+    case.
+    """
+    xml_path = os.path.join("models", "yolov4-tiny.xml")
+    bin_path = os.path.join("models", "yolov4-tiny.bin")
+    if not (os.path.exists(xml_path) and os.path.exists(bin_path)):
+        return None
+    if cv2.dnn.DNN_TARGET_CPU not in cv2.dnn.getAvailableTargets(cv2.dnn.DNN_BACKEND_INFERENCE_ENGINE):
+        print("WARNING: Found an OpenVINO model, but OpenCV was built without OpenVINO support.")
+        return None
+
+    try:
+        net = cv2.dnn.readNet(xml_path, bin_path)
+    except cv2.error as e:
+        print(f"WARNING: Could not load the OpenVINO model, falling back to darknet. {e}")
+        return None
+    net.setPreferableBackend(cv2.dnn.DNN_BACKEND_INFERENCE_ENGINE)
+    net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+    # Exports that split boxes and class scores into separate outputs (as
+    # darknet2onnx does) cannot go through the usual post-processing
+    try:
+        net.setInput(np.zeros((1, 3, INPUT_SIZE[1], INPUT_SIZE[0]), dtype=np.float32))
+        shapes = [output.shape for output in net.forward(_get_output_layers(net))]
+    except cv2.error as e:
+        print(f"WARNING: Could not run the OpenVINO model, falling back to darknet. {e}")
+        return None
+    if not shapes or any(shape[-1] != 5 + num_classes for shape in shapes):
+        print(f"WARNING: OpenVINO model outputs {shapes} are not in the expected layout, falling back to darknet.")
+        return None
+    return net
+
+def _select_cuda_target(net, output_layers):
+    """
+    Selects the half precision CUDA target, falling back to full precision
+    if the device cannot run the network in FP16.
+
+    A warm-up forward pass is used as the probe, since OpenCV only reports
+    an unsupported target once the network is actually run.
+    """
+    net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA_FP16)
+    warmup_blob = np.zeros((1, 3, INPUT_SIZE[1], INPUT_SIZE[0]), dtype=np.float32)
+    try:
+        net.setInput(warmup_blob)
+        net.forward(output_layers)
+    except cv2.error as e:
+        print(f"WARNING: FP16 inference is not supported on this GPU, using FP32. {e}")
+        net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA)
+
+def load_net():
+    """
+    Loads the network, class names and output layer names on first use.
+
+    The loaded model is kept in module globals so that repeated calls to
+    detect() only pay for inference, not for disk I/O and network
+    construction. The model is shared by every caller in the process.
+    """
+    global _NET, _OUTPUT_LAYERS, _CLASSES, _FOOD_CLASS_MASK, _TRT_ENGINE
+
+    with _MODEL_LOCK:
+        if _CLASSES is not None:
+            return
+
+        download_model_files()
+
+        weights_path = os.path.join("models", "yolov4-tiny.weights")
+        config_path = os.path.join("models", "yolov4-tiny.cfg")
+        names_path = os.path.join("models", "coco.names")
+
+        with open(names_path, "r") as f:
+            classes = [line.strip() for line in f.readlines()]
+
+        _TRT_ENGINE = _load_tensorrt_engine(len(classes))
+        if _TRT_ENGINE is None:
+            if _has_cuda():
+                net = cv2.dnn.readNet(weights_path, config_path)
+                net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
+                _select_cuda_target(net, _get_output_layers(net))
+            else:
+                net = _load_openvino_net(len(classes))
+                if net is None:
+                    print("WARNING: No CUDA device available to OpenCV, running detection on the CPU.")
+                    net = cv2.dnn.readNet(weights_path, config_path)
+                    net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+                    net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+            _OUTPUT_LAYERS = _get_output_layers(net)
+            _NET = net
+
+        # Lookup table indexed by class id, so the food filter is a single
+        # gather instead of a set membership test per candidate.
+        _FOOD_CLASS_MASK = np.array([c in FOOD_ITEMS for c in classes], dtype=bool)
+        _CLASSES = classes
+
+def _resize_to_input(image):
+    """
+    Shrinks an image to the network's input size.
+
+    This happens before any other preprocessing, so the contrast adjustment
+    only touches INPUT_SIZE pixels instead of the full frame. Boxes come out
+    of the network in relative coordinates, so they still map back to the
+    original frame.
+
+    When OpenCL is enabled, the image is wrapped in a UMat so that the
+    resize and the contrast adjustment run as OpenCL kernels.
+    """
+    size = image.shape[1::-1]
+    if cv2.ocl.useOpenCL():
+        image = cv2.UMat(image)
+    if size == INPUT_SIZE:
+        return image
+    return cv2.resize(image, INPUT_SIZE, interpolation=cv2.INTER_AREA)
+
+def prepare_blob(image: np.ndarray):
+    """
+    Preprocesses an image into the network's input blob.
+
+    The blob only depends on the image, so callers that run detection on
+    the same frame more than once can build it once and pass it to
+    run_detection() directly.
+
+    Args:
+        image: The input image as a NumPy array.
+
+    Returns:
+        A tuple (blob, height, width), where height and width are the size
+        of the original image that boxes will be scaled back to.
+    """
+    height, width = image.shape[:2]
+
+    # Apply preprocessing to the input image once it is at the network size
+    image = preprocess_image(_resize_to_input(image))
+
+    blob = cv2.dnn.blobFromImage(image, 1 / 255.0, INPUT_SIZE, swapRB=True, crop=False)
+    return blob, height, width
+
+def prepare_batch_blob(images):
+    """
+    Preprocesses several images into a single batched input blob.
+
+    Args:
+        images: A list of input images as NumPy arrays.
+
+    Returns:
+        A tuple (blob, sizes), where blob has one entry per image and sizes
+        holds the (height, width) of each original image.
+    """
+    sizes = [image.shape[:2] for image in images]
+    images = [preprocess_image(_resize_to_input(image)) for image in images]
+    blob = cv2.dnn.blobFromImages(images, 1 / 255.0, INPUT_SIZE, swapRB=True, crop=False)
+    return blob, sizes
+
+def run_detection(blob, height: int, width: int, confidence_threshold: float = 0.3, nms_threshold: float = 0.4):
+    """
+    Runs the detector on a blob built by prepare_blob().
+
+    Args:
+        blob: The network input blob.
+        height: The height of the image the blob was built from.
+        width: The width of the image the blob was built from.
+        confidence_threshold: The minimum probability to filter weak detections.
+        nms_threshold: The threshold for non-maxima suppression.
+
+    Returns:
+        The same list of detections as detect().
+    """
+    return run_batch_detection(blob, [(height, width)], confidence_threshold, nms_threshold)[0]
+
+def run_batch_detection(blob, sizes, confidence_threshold: float = 0.3, nms_threshold: float = 0.4):
+    """
+    Runs the detector on a blob built by prepare_batch_blob() in a single
+    forward pass.
+
+    Args:
+        blob: The batched network input blob.
+        sizes: The (height, width) of each image the blob was built from.
+        confidence_threshold: The minimum probability to filter weak detections.
+        nms_threshold: The threshold for non-maxima suppression.
+
+    Returns:
+        One list of detections per image, as returned by detect().
+    """
+    load_net()
+
+    # The shared network keeps its input blob between calls, so inference
+    # must not interleave across threads.
+    with _MODEL_LOCK:
+        if _TRT_ENGINE is not None:
+            # The TensorRT engine is built for a batch size of one
+            batch_outputs = [_TRT_ENGINE.infer(blob[i:i + 1]) for i in range(len(sizes))]
+        else:
+            _NET.setInput(blob)
+            layer_outputs = _NET.forward(_OUTPUT_LAYERS)
+            # Output layers are (N, 85) for a single image and (B, N, 85) for
+            # a batch.
+            batch_outputs = [
+                [output[i] if output.ndim == 3 else output for output in layer_outputs]
+                for i in range(len(sizes))
+            ]
+
+    return [
+        _postprocess(np.vstack(outputs), height, width, confidence_threshold, nms_threshold)
+        for outputs, (height, width) in zip(batch_outputs, sizes)
+    ]
+
+def _postprocess(detections, height, width, confidence_threshold, nms_threshold):
+    """
+    Turns the raw candidates for one image into a list of food detections.
+    """
+    # Filter all candidates from every output layer in one vectorized pass.
+    # Non-food classes are dropped here so they never reach NMS.
+    scores = detections[:, 5:]
+    class_ids = scores.argmax(axis=1)
+    confidences = scores[np.arange(len(scores)), class_ids]
+    mask = (confidences > confidence_threshold) & _FOOD_CLASS_MASK[class_ids]
+
+    # Most frames have no food in them; skip box conversion and NMS entirely
+    if not mask.any():
+        return []
+
+    detections = detections[mask]
+    class_ids = class_ids[mask]
+    confidences = confidences[mask]
+
+    w = (detections[:, 2] * width).astype(int)
+    h = (detections[:, 3] * height).astype(int)
+    cx = (detections[:, 0] * width).astype(int)
+    cy = (detections[:, 1] * height).astype(int)
+    x = (cx - w / 2).astype(int)
+    y = (cy - h / 2).astype(int)
+    boxes = np.stack([x, y, w, h], axis=1).tolist()
+    confidences = confidences.tolist()
+
+    indexes = cv2.dnn.NMSBoxes(boxes, confidences, confidence_threshold, nms_threshold)
+
+    results = []
+    if len(indexes) > 0:
+        for i in indexes.flatten():
+            results.append({
+                "label": _CLASSES[class_ids[i]],
+                "confidence": confidences[i],
+                "box": tuple(boxes[i]),
+            })
+
+    return results
+
+def detect(image: np.ndarray, confidence_threshold: float = 0.3, nms_threshold: float = 0.4):
+    """
+    Detects food items in an image.
+
+    Args:
+        image: The input image as a NumPy array.
+        confidence_threshold: The minimum probability to filter weak detections.
+        nms_threshold: The threshold for non-maxima suppression.
+
+    Returns:
+        A list of dicts, one per detected food item, with its "label",
+        "confidence" and bounding "box" (x, y, w, h).
+    """
+    blob, height, width = prepare_blob(image)
+    return run_detection(blob, height, width, confidence_threshold, nms_threshold)
+
+def detect_batch(images, confidence_threshold: float = 0.3, nms_threshold: float = 0.4):
+    """
+    Detects food items in several images with a single forward pass.
+
+    Args:
+        images: A list of input images as NumPy arrays.
+        confidence_threshold: The minimum probability to filter weak detections.
+        nms_threshold: The threshold for non-maxima suppression.
+
+    Returns:
+        One list of detections per image, as returned by detect().
+    """
+    if not images:
+        return []
+    blob, sizes = prepare_batch_blob(images)
+    return run_batch_detection(blob, sizes, confidence_threshold, nms_threshold)